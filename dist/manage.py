@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
 import json
 import logging
+import re
 import shutil
 import sys
 import os
-import random
-import string
+import secrets
 import zipfile
-import tomllib
 # Include the virtual environment site-packages in sys.path
 here = os.path.dirname(os.path.realpath(__file__))
 if not os.path.exists(os.path.join(here, '.venv')):
@@ -45,6 +44,26 @@ from warlock_manager.mods.warlock_nexus_mod import WarlockNexusMod
 #from warlock_manager.mods.base_mod import BaseMod
 
 here = os.path.dirname(os.path.realpath(__file__))
+SETTINGS_FILE = os.path.join(here, '.settings.ini')
+
+# Files stored within each service's application directory
+SERVER_JAR = 'minecraft_server.jar'
+VERSION_FILE = '.version'
+SAVE_FILES = ('banned-ips.json', 'banned-players.json', 'ops.json', 'whitelist.json')
+# Suffixes appended to the level name for each dimension's world directory
+WORLD_SUFFIXES = ('', '_nether', '_the_end')
+
+# Options which determine whether the RCON API is usable
+API_OPTIONS = ('Enable RCON', 'RCON Port', 'RCON Password')
+
+# Upstream sources for game server and Fabric loader releases
+VERSION_MANIFEST_URL = 'https://piston-meta.mojang.com/mc/game/version_manifest_v2.json'
+FABRIC_LOADER_URL = 'https://meta.fabricmc.net/v2/versions/loader'
+FABRIC_INSTALLER_URL = 'https://meta.fabricmc.net/v2/versions/installer'
+FABRIC_SERVER_JAR_URL = 'https://meta.fabricmc.net/v2/versions/loader/%s/%s/%s/server/jar'
+
+# Response from '/list', ie: 'There are 2 of a max of 20 players online: ...'
+LIST_RE = re.compile(r'There are (\d+) of a max')
 
 
 class GameMod(WarlockNexusMod):
@@ -63,6 +82,9 @@ class GameMod(WarlockNexusMod):
 			if mod.package == basename:
 				return mod
 
+		# Only needed when inspecting a new jar, so skip loading it for already-registered mods
+		import tomllib
+
 		mod_data = None
 		manifest_data = None
 		jar_data = {}
@@ -181,9 +203,11 @@ class GameApp(ManualApp):
 		self.mod_handler = GameMod
 		self.multi_binary = True
 		self._latest_version = None
+		self._version_manifest = None
+		self._fabric_launcher_version = None
 
 		self.configs = {
-			'manager': INIConfig('manager', os.path.join(here, '.settings.ini'))
+			'manager': INIConfig('manager', SETTINGS_FILE)
 		}
 		self.load()
 
@@ -212,6 +236,16 @@ class GameApp(ManualApp):
 				service.reload()
 		return True
 
+	def get_version_manifest(self) -> dict:
+		"""
+		Get the Mojang version manifest, listing every version of the game server available
+
+		:return:
+		"""
+		if self._version_manifest is None:
+			self._version_manifest = download_json(VERSION_MANIFEST_URL)
+		return self._version_manifest
+
 	def get_latest_version(self) -> str | None:
 		"""
 		Get the latest released version available for the game server
@@ -222,8 +256,7 @@ class GameApp(ManualApp):
 		if self._latest_version is not None:
 			return self._latest_version
 
-		src_manifest = 'https://piston-meta.mojang.com/mc/game/version_manifest_v2.json'
-		dat = download_json(src_manifest)
+		dat = self.get_version_manifest()
 		if 'latest' in dat and 'release' in dat['latest']:
 			self._latest_version = dat['latest']['release']
 			return self._latest_version
@@ -237,8 +270,7 @@ class GameApp(ManualApp):
 		Pulls the data live from Mojang's version manifest, which is updated with every release.
 		:return:
 		"""
-		src_manifest = 'https://piston-meta.mojang.com/mc/game/version_manifest_v2.json'
-		dat = download_json(src_manifest)
+		dat = self.get_version_manifest()
 		versions = ['latest']
 		for version in dat['versions']:
 			if version['type'] == 'release':
@@ -250,8 +282,7 @@ class GameApp(ManualApp):
 		Get all versions of the Fabric mod loader available.
 		:return:
 		"""
-		src = 'https://meta.fabricmc.net/v2/versions/loader'
-		dat = download_json(src)
+		dat = download_json(FABRIC_LOADER_URL)
 		versions = ['none']
 		counter = 0
 		for version in dat:
@@ -267,11 +298,14 @@ class GameApp(ManualApp):
 
 		:return:
 		"""
-		src = 'https://meta.fabricmc.net/v2/versions/installer'
-		dat = download_json(src)
+		if self._fabric_launcher_version is not None:
+			return self._fabric_launcher_version
+
+		dat = download_json(FABRIC_INSTALLER_URL)
 		for version in dat:
 			if version['stable']:
-				return version['version']
+				self._fabric_launcher_version = version['version']
+				return self._fabric_launcher_version
 		return None
 
 	def get_download_url(self, version: str) -> str | None:
@@ -281,11 +315,9 @@ class GameApp(ManualApp):
 		Pulls live data from the Mojang version manifest.
 		:return:
 		"""
-		from pprint import pprint
 		logging.debug('Searching for download URL for version %s...' % version)
-		src_manifest = 'https://piston-meta.mojang.com/mc/game/version_manifest_v2.json'
 		meta_url = None
-		dat = download_json(src_manifest)
+		dat = self.get_version_manifest()
 		for version_dat in dat['versions']:
 			if version_dat['id'] == version:
 				meta_url = version_dat['url']
@@ -317,12 +349,27 @@ class GameService(RCONService):
 		super().__init__(service, game)
 		self.service = service
 		self.game = game
+		# Option values and the derived API flag, invalidated in option_value_updated()
+		self._option_cache = {}
+		self._api_enabled = None
+		app_directory = self.get_app_directory()
+		self._version_file = os.path.join(app_directory, VERSION_FILE)
 		self.configs = {
-			'server': PropertiesConfig('server', os.path.join(self.get_app_directory(), 'server.properties')),
-			'service': INIConfig('service', os.path.join(self.get_app_directory(), '.service.ini'))
+			'server': PropertiesConfig('server', os.path.join(app_directory, 'server.properties')),
+			'service': INIConfig('service', os.path.join(app_directory, '.service.ini'))
 		}
 		self.load()
 
+	def get_option_value(self, option: str):
+		"""
+		Get the value of a configuration option, cached for the lifetime of this instance
+		:param option:
+		:return:
+		"""
+		if option not in self._option_cache:
+			self._option_cache[option] = super().get_option_value(option)
+		return self._option_cache[option]
+
 	def option_value_updated(self, option: str, previous_value, new_value):
 		"""
 		Handle any special actions needed when an option value is updated
@@ -331,6 +378,9 @@ class GameService(RCONService):
 		:param new_value:
 		:return:
 		"""
+		self._option_cache.pop(option, None)
+		if option in API_OPTIONS:
+			self._api_enabled = None
 
 		# Special option actions
 		if option == 'Server Port':
@@ -377,11 +427,13 @@ class GameService(RCONService):
 		Check if API is enabled for this service
 		:return:
 		"""
-		return (
-			self.get_option_value('Enable RCON') and
-			self.get_option_value('RCON Port') != '' and
-			self.get_option_value('RCON Password') != ''
-		)
+		if self._api_enabled is None:
+			self._api_enabled = bool(
+				self.get_option_value('Enable RCON') and
+				self.get_option_value('RCON Port') != '' and
+				self.get_option_value('RCON Password') != ''
+			)
+		return self._api_enabled
 
 	def get_api_port(self) -> int:
 		"""
@@ -407,10 +459,8 @@ class GameService(RCONService):
 			# ret should contain 'There are N of a max...' where N is the player count.
 			if ret is None:
 				return None
-			elif 'There are ' in ret:
-				return int(ret[10:ret.index(' of a max')].strip())
-			else:
-				return None
+			match = LIST_RE.search(ret)
+			return int(match.group(1)) if match else None
 		except:
 			return None
 
@@ -512,7 +562,7 @@ class GameService(RCONService):
 		Get the full executable for this game service
 		:return:
 		"""
-		binary = 'minecraft_server.jar'
+		binary = SERVER_JAR
 
 		target_fabric_version = self.get_option_value('Service Fabric Mod Loader')
 		if target_fabric_version != 'none':
@@ -544,12 +594,13 @@ class GameService(RCONService):
 		"""
 
 		ret = []
-		if not os.path.exists(os.path.join(self.get_app_directory(), 'mods')):
+		mods_directory = os.path.join(self.get_app_directory(), 'mods')
+		if not os.path.exists(mods_directory):
 			return ret
 
-		for file in os.listdir(os.path.join(self.get_app_directory(), 'mods')):
+		for file in os.listdir(mods_directory):
 			if file.endswith('.jar'):
-				ret.append(GameMod.from_jar(os.path.join(self.get_app_directory(), 'mods', file)))
+				ret.append(GameMod.from_jar(os.path.join(mods_directory, file)))
 
 		return ret
 
@@ -628,7 +679,7 @@ class GameService(RCONService):
 		self.option_ensure_set('RCON Port')
 		if not self.option_has_value('RCON Password'):
 			# Generate a random password for RCON
-			random_password = ''.join(random.choices(string.ascii_letters + string.digits, k=32))
+			random_password = secrets.token_urlsafe(24)
 			self.set_option('RCON Password', random_password)
 		if not self.option_has_value('Enable RCON'):
 			self.set_option('Enable RCON', True)
@@ -646,7 +697,7 @@ class GameService(RCONService):
 		:return:
 		"""
 		logging.debug('Checking for updates on %s' % self.get_name())
-		version_file = os.path.join(self.get_app_directory(), '.version')
+		version_file = self._version_file
 		target_version = self.get_target_version()
 
 		if os.path.exists(version_file):
@@ -660,13 +711,33 @@ class GameService(RCONService):
 			logging.debug('No version file found, assuming update is available.')
 			return True
 
+	def _download_replace(self, url: str, target: str):
+		"""
+		Download a file to a '.part' sibling of the target and swap it into place once complete
+
+		An interrupted download never leaves a truncated file at the target path.
+		The temporary file must stay in the same directory, (same filesystem),
+		so os.replace is an atomic rename instead of a copy.
+		:param url:
+		:param target:
+		:return:
+		"""
+		try:
+			download_file(url, target + '.part')
+		except:
+			# Don't leave a partial download lying around in the app directory
+			if os.path.exists(target + '.part'):
+				os.remove(target + '.part')
+			raise
+		os.replace(target + '.part', target)
+
 	def update(self):
 		"""
 		Update the game server to the latest version
 
 		:return:
 		"""
-		version_file = os.path.join(self.get_app_directory(), '.version')
+		version_file = self._version_file
 		target_version = self.get_target_version()
 		download_url = self.game.get_download_url(target_version)
 
@@ -688,10 +759,16 @@ class GameService(RCONService):
 			logging.info('Minecraft Server is already at the latest version (%s).' % target_version)
 		else:
 			logging.info('Updating Minecraft Server to version %s...' % target_version)
-			download_file(download_url, os.path.join(self.get_app_directory(), 'minecraft_server.jar'))
+			self._download_replace(download_url, os.path.join(self.get_app_directory(), SERVER_JAR))
 
-			with open(version_file, 'w') as f:
-				f.write(target_version)
+			try:
+				with open(version_file + '.part', 'w') as f:
+					f.write(target_version)
+			except:
+				if os.path.exists(version_file + '.part'):
+					os.remove(version_file + '.part')
+				raise
+			os.replace(version_file + '.part', version_file)
 			utils.ensure_file_ownership(version_file)
 
 		# Check fabric too
@@ -702,10 +779,10 @@ class GameService(RCONService):
 				logging.error('Failed to retrieve Fabric launcher version.')
 				return False
 			target_file = 'fabric-server-mc.%s-loader.%s-launcher.%s.jar' % (target_version, target_fabric_version, launcher_version)
-			source_file = 'https://meta.fabricmc.net/v2/versions/loader/%s/%s/%s/server/jar' % (target_version, target_fabric_version, launcher_version)
+			source_file = FABRIC_SERVER_JAR_URL % (target_version, target_fabric_version, launcher_version)
 			if not os.path.exists(os.path.join(self.get_app_directory(), target_file)):
 				logging.info('Downloading Fabric server loader %s...' % target_file)
-				download_file(source_file, os.path.join(self.get_app_directory(), target_file))
+				self._download_replace(source_file, os.path.join(self.get_app_directory(), target_file))
 			else:
 				logging.info('Fabric server loader %s already exists.' % target_file)
 		print('Update complete.')
@@ -717,15 +794,8 @@ class GameService(RCONService):
 
 		:return:
 		"""
-		return [
-			'banned-ips.json',
-			'banned-players.json',
-			'ops.json',
-			'whitelist.json',
-			self.get_name(),
-			self.get_name() + '_nether',
-			self.get_name() + '_the_end'
-		]
+		level_name = self.get_name()
+		return [*SAVE_FILES, *(level_name + suffix for suffix in WORLD_SUFFIXES)]
 
 	def get_version(self) -> str | None:
 		"""
@@ -733,7 +803,7 @@ class GameService(RCONService):
 
 		:return:
 		"""
-		version_file = os.path.join(self.get_app_directory(), '.version')
+		version_file = self._version_file
 		if os.path.exists(version_file):
 			with open(version_file, 'r') as f:
 				current_version = f.read().strip()